@@ -1,7 +1,8 @@
 import asyncio
-import base64
-import queue
-import threading
+import collections
+import concurrent.futures
+import orjson
+import pybase64
 from typing import Callable
 from elevenlabs.conversational_ai.conversation import AudioInterface
 import websockets
@@ -9,82 +10,167 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Cap a single outbound batch at ~200ms of 8kHz mu-law audio (a single larger
+# chunk is still sent whole, on its own)
+MAX_BATCH_BYTES = 1600
+
+# High-water mark for queued output chunks; beyond it the oldest audio is dropped
+# so one slow Twilio peer builds up loss rather than unbounded latency
+OUTPUT_QUEUE_MAX_CHUNKS = 50
+
+# Upper bound on a single media send, so a hung peer cannot wedge its sender task
+SEND_TIMEOUT_SECONDS = 0.5
+
+# Closes the JSON envelope opened by the per-stream media prefix
+_MEDIA_SUFFIX = b'"}}'
+
+# How long the SDK thread waits for a clear message to reach Twilio on barge-in
+CLEAR_TIMEOUT_SECONDS = 1.0
+
 
 class TwilioAudioInterface(AudioInterface):
     def __init__(self, websocket):
         self.websocket = websocket
-        self.output_queue = queue.Queue()
-        self.should_stop = threading.Event()
+        # deque append/popleft/clear are atomic, so the SDK thread and the loop share it safely
+        self.output_queue = collections.deque(maxlen=OUTPUT_QUEUE_MAX_CHUNKS)
+        # Drop accounting uses single-writer counters: the SDK thread only bumps
+        # _dropped_chunks and the loop only advances _reported_drops, so no update is lost
+        self._dropped_chunks = 0
+        self._reported_drops = 0
+        self._output_ready = asyncio.Event()
+        # Reused to assemble multi-frame batches without a per-send allocation
+        self._out_scratch = bytearray(8192)
         self.stream_sid = None
+        self._media_prefix = None
+        self._set_stream_sid(None)
         self.input_callback = None
-        self.output_thread = None
+        # Created from the FastAPI handler, so this is the loop serving the websocket
+        self.loop = asyncio.get_running_loop()
+        self._sender_task = None
 
     def start(self, input_callback: Callable[[bytes], None]):
         """Start audio processing"""
         self.input_callback = input_callback
-        self.output_thread = threading.Thread(target=self._output_thread)
-        self.output_thread.daemon = True
-        self.output_thread.start()
+        self._sender_task = asyncio.run_coroutine_threadsafe(self._sender_loop(), self.loop)
 
     def stop(self):
         """Stop audio processing"""
-        self.should_stop.set()
-        if self.output_thread:
-            self.output_thread.join(timeout=5.0)
-        self.stream_sid = None
+        if self._sender_task:
+            self._sender_task.cancel()
+            self._sender_task = None
+        self._set_stream_sid(None)
 
     def output(self, audio: bytes):
         """Queue audio for output"""
-        self.output_queue.put(audio)
+        # A full deque discards its oldest chunk on append. The length check and the
+        # append are separate steps, so the drop count is approximate: the sender may
+        # pop in between, making a counted drop not actually happen.
+        if len(self.output_queue) == OUTPUT_QUEUE_MAX_CHUNKS:
+            self._dropped_chunks += 1
+        self.output_queue.append(audio)
+        self.loop.call_soon_threadsafe(self._output_ready.set)
 
     def interrupt(self):
         """Clear output queue and send clear message"""
+        self.output_queue.clear()
+        future = asyncio.run_coroutine_threadsafe(self._send_clear_message(), self.loop)
         try:
-            while True:
-                _ = self.output_queue.get(block=False)
-        except queue.Empty:
-            pass
-        asyncio.run(self._send_clear_message())
+            # Block the SDK thread so no new audio is queued ahead of the clear
+            future.result(timeout=CLEAR_TIMEOUT_SECONDS)
+        except concurrent.futures.TimeoutError:
+            logger.warning("Timed out sending clear message to Twilio")
 
-    async def handle_twilio_message(self, data):
-        """Process incoming Twilio WebSocket messages"""
+    def handle_media(self, payload):
+        """Decode an inbound Twilio media payload and forward it to ElevenLabs"""
         try:
-            if data.get("event") == "start":
-                self.stream_sid = data["start"].get("streamSid")
-                logger.info(f"Started stream with stream_sid: {self.stream_sid}")
-
-            if data.get("event") == "media":
-                audio_data = base64.b64decode(data["media"]["payload"])
-                if self.input_callback:
-                    self.input_callback(audio_data)
+            audio_data = pybase64.b64decode(payload)
+            if self.input_callback:
+                self.input_callback(audio_data)
         except Exception as e:
-            logger.error(f"Error processing Twilio message: {e}")
+            logger.error("Error processing Twilio media: %s", e)
 
-    def _output_thread(self):
-        """Background thread for sending audio"""
-        while not self.should_stop.is_set():
-            asyncio.run(self._send_audio_to_twilio())
+    async def handle_control(self, data):
+        """Process Twilio control messages: start, plus media frames the fast path could not slice"""
+        try:
+            event = data.get("event")
+            if event == "start":
+                self._set_stream_sid(data["start"].get("streamSid"))
+                logger.info("Started stream with stream_sid: %s", self.stream_sid)
+            elif event == "media":
+                self.handle_media(data["media"]["payload"])
+        except Exception as e:
+            logger.error("Error processing Twilio message: %s", e)
 
-    async def _send_audio_to_twilio(self):
-        """Send audio payload to Twilio"""
+    def _set_stream_sid(self, stream_sid):
+        """Set the stream SID and rebuild the outbound media message prefix"""
+        self.stream_sid = stream_sid
+        self._media_prefix = (
+            b'{"event":"media","streamSid":%s,"media":{"payload":"' % orjson.dumps(stream_sid)
+        )
+
+    async def _sender_loop(self):
+        """Long-lived task forwarding queued audio to Twilio in batches"""
+        while True:
+            await self._output_ready.wait()
+            self._output_ready.clear()
+            dropped = self._dropped_chunks
+            if dropped != self._reported_drops:
+                logger.warning(
+                    "Output queue full, dropped ~%d audio chunks", dropped - self._reported_drops
+                )
+                self._reported_drops = dropped
+            while True:
+                chunks = self._pop_batch()
+                if not chunks:
+                    break
+                await self._send_audio_to_twilio(self._assemble_batch(chunks))
+
+    def _pop_batch(self):
+        """Pop queued chunks totalling at most MAX_BATCH_BYTES, always taking at least one"""
+        chunks = []
+        size = 0
         try:
-            audio = self.output_queue.get(timeout=0.2)
-            audio_payload = base64.b64encode(audio).decode("utf-8")
-            audio_delta = {
-                "event": "media",
-                "streamSid": self.stream_sid,
-                "media": {"payload": audio_payload},
-            }
-            await self.websocket.send_json(audio_delta)
-        except queue.Empty:
+            while True:
+                # Peek first so a chunk that would overflow the batch stays queued
+                if chunks and size + len(self.output_queue[0]) > MAX_BATCH_BYTES:
+                    break
+                chunk = self.output_queue.popleft()
+                chunks.append(chunk)
+                size += len(chunk)
+        except IndexError:
             pass
+        return chunks
+
+    def _assemble_batch(self, chunks):
+        """Concatenate chunks into the reusable scratch buffer"""
+        if len(chunks) == 1:
+            return chunks[0]
+        total = sum(len(chunk) for chunk in chunks)
+        if total > len(self._out_scratch):
+            return b"".join(chunks)
+        offset = 0
+        for chunk in chunks:
+            self._out_scratch[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        return memoryview(self._out_scratch)[:total]
+
+    async def _send_audio_to_twilio(self, audio):
+        """Send audio payload to Twilio"""
+        try:
+            frame = b"".join((self._media_prefix, pybase64.b64encode(audio), _MEDIA_SUFFIX))
+            # Twilio only accepts JSON text frames, so decode the finished frame once
+            await asyncio.wait_for(
+                self.websocket.send_text(frame.decode("ascii")), timeout=SEND_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Timed out sending audio to Twilio")
         except Exception as e:
-            logger.error(f"Error sending audio to Twilio: {e}")
+            logger.error("Error sending audio to Twilio: %s", e)
 
     async def _send_clear_message(self):
         """Send clear message to Twilio"""
         try:
             clear_message = {"event": "clear", "streamSid": self.stream_sid}
-            await self.websocket.send_json(clear_message)
+            await self.websocket.send_text(orjson.dumps(clear_message).decode())
         except Exception as e:
-            logger.error(f"Error sending clear message: {e}")
\ No newline at end of file
+            logger.error("Error sending clear message: %s", e)
\ No newline at end of file
@@ -1,12 +1,20 @@
-from pydantic_settings import BaseSettings
+import os
+from dataclasses import dataclass, fields
 
-class Settings(BaseSettings):
+
+@dataclass(frozen=True, slots=True)
+class Settings:
     """Application configuration settings"""
     elevenlabs_api_key: str
     agent_id: str
     twilio_account_sid: str
     twilio_auth_token: str
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
\ No newline at end of file
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Build settings from environment variables (load .env first)"""
+        names = [field.name for field in fields(cls)]
+        missing = [name.upper() for name in names if name.upper() not in os.environ]
+        if missing:
+            raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
+        return cls(**{name: os.environ[name.upper()] for name in names})
\ No newline at end of file
@@ -1,9 +1,14 @@
-import json
+import asyncio
+import atexit
 import traceback
 import os
 import logging
-from typing import Optional
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import AsyncIterator, Optional, Union
 
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, JSONResponse
@@ -19,22 +24,74 @@ from elevenlabs.conversational_ai.conversation import Conversation
 from audio_interface import TwilioAudioInterface
 from config import Settings
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
+def get_worker_count() -> int:
+    """Number of uvicorn workers: WEB_CONCURRENCY if set, else the CPUs this process may run on"""
+    if os.environ.get("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+# Configure logging; records are written by a background listener thread so
+# file and console I/O never block the event loop or the ElevenLabs SDK thread.
+# Skip per-record thread/process lookups and caller frame walking, and log the
+# raw epoch timestamp rather than formatting asctime for every record.
+logging.logThreads = False
+logging.logMultiprocessing = False
+logging._srcfile = None
+# WEB_CONCURRENCY is the worker count uvicorn was actually started with (exported
+# by __main__ below, and read by the uvicorn CLI), so workers see the same value.
+if int(os.environ.get("WEB_CONCURRENCY") or 1) > 1:
+    # Several processes cannot safely share app.log; each worker gets its own file
+    logging.logProcesses = True
+    log_formatter = logging.Formatter('%(created).3f %(process)d %(levelname)s %(message)s')
+    log_handlers = [
+        logging.FileHandler(f"app.{os.getpid()}.log"),
+        logging.StreamHandler()
+    ]
+else:
+    logging.logProcesses = False
+    log_formatter = logging.Formatter('%(created).3f %(levelname)s %(message)s')
+    log_handlers = [
         logging.FileHandler("app.log"),
         logging.StreamHandler()
     ]
+for log_handler in log_handlers:
+    log_handler.setFormatter(log_formatter)
+
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+logging.basicConfig(
+    level=logging.INFO,
+    handlers=[QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
+# Twilio sends compact JSON, so media frames can be routed and sliced without parsing
+# (str and bytes forms, matching text and binary frames)
+MEDIA_EVENT_MARKER = '"event":"media"'
+MEDIA_EVENT_MARKER_BYTES = MEDIA_EVENT_MARKER.encode()
+MEDIA_PAYLOAD_KEY = '"payload":"'
+MEDIA_PAYLOAD_KEY_BYTES = MEDIA_PAYLOAD_KEY.encode()
+
+# Cached health verdicts older than this are refreshed by the next /health request
+HEALTH_REFRESH_SECONDS = 10
+
+# Upper bound on one connectivity check; the Twilio client has no request timeout
+HEALTH_CHECK_TIMEOUT_SECONDS = 5
+
+# Verdicts older than this are not served; the request waits for a fresh check instead
+HEALTH_MAX_AGE_SECONDS = 3 * HEALTH_REFRESH_SECONDS
+
 # Load environment variables
 load_dotenv()
 
 # Initialize configuration
-settings = Settings()
+settings = Settings.from_env()
 
 # Initialize Twilio Client
 try:
@@ -43,7 +100,7 @@ try:
         settings.twilio_auth_token
     )
 except Exception as e:
-    logger.error(f"Twilio Client Initialization Error: {e}")
+    logger.error("Twilio Client Initialization Error: %s", e)
     raise
 
 # Initialize ElevenLabs Client
@@ -52,7 +109,7 @@ try:
         api_key=settings.elevenlabs_api_key
     )
 except Exception as e:
-    logger.error(f"ElevenLabs Client Initialization Error: {e}")
+    logger.error("ElevenLabs Client Initialization Error: %s", e)
     raise
 
 # Create FastAPI app
@@ -68,15 +125,55 @@ app.add_middleware(
 )
 
 
+def is_media_message(message: Union[str, bytes]) -> bool:
+    """Check a raw Twilio message for the media event marker"""
+    if isinstance(message, str):
+        return MEDIA_EVENT_MARKER in message
+    return MEDIA_EVENT_MARKER_BYTES in message
+
+
+def extract_media_payload(message: Union[str, bytes]) -> Optional[Union[str, bytes]]:
+    """Slice the base64 payload out of a raw Twilio media message"""
+    if isinstance(message, str):
+        key, quote = MEDIA_PAYLOAD_KEY, '"'
+    else:
+        key, quote = MEDIA_PAYLOAD_KEY_BYTES, b'"'
+    start = message.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    # Base64 never contains quotes or escapes, so the next quote ends the payload
+    end = message.find(quote, start)
+    if end < 0:
+        return None
+    return message[start:end]
+
+
+async def iter_frames(websocket: WebSocket) -> AsyncIterator[Union[str, bytes]]:
+    """Yield WebSocket frames as delivered: str for text frames, bytes for binary"""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        frame = message.get("text")
+        yield frame if frame is not None else message.get("bytes")
+
+
 @app.get("/")
 async def root():
     """Root endpoint for health check"""
     return {"status": "Server is running", "message": "Twilio-ElevenLabs Voice Integration"}
 
 
-@app.get("/health")
-async def health_check():
-    """Comprehensive health check endpoint"""
+# Last health verdict as (monotonic timestamp, status code, content)
+health_cache = (0.0, None, None)
+health_refresh_task: Optional[asyncio.Task] = None
+# The check_health thread itself, which keeps running if a refresh gives up on it
+health_check_task: Optional[asyncio.Future] = None
+
+
+def check_health():
+    """Check ElevenLabs and Twilio connectivity (blocking)"""
     try:
         # Check ElevenLabs connectivity
         agents = eleven_labs_client.conversational_ai.list_agents()
@@ -84,7 +181,7 @@ async def health_check():
         # Check Twilio connectivity
         twilio_client.calls.list(limit=1)
 
-        return {
+        return 200, {
             "status": "healthy",
             "elevenlabs": {
                 "status": "connected",
@@ -95,14 +192,55 @@ async def health_check():
             }
         }
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return JSONResponse(
-            status_code=500,
-            content={
-                "status": "unhealthy",
-                "error": str(e)
-            }
+        logger.error("Health check failed: %s", e)
+        return 500, {
+            "status": "unhealthy",
+            "error": str(e)
+        }
+
+
+async def refresh_health_cache():
+    """Re-run the health check off the event loop and cache the verdict"""
+    global health_cache, health_check_task
+    # Reuse a check that is still hung rather than starting another thread
+    if health_check_task is None or health_check_task.done():
+        health_check_task = asyncio.ensure_future(asyncio.to_thread(check_health))
+    try:
+        status_code, content = await asyncio.wait_for(
+            asyncio.shield(health_check_task), timeout=HEALTH_CHECK_TIMEOUT_SECONDS
         )
+    except asyncio.TimeoutError:
+        logger.error("Health check timed out after %ss", HEALTH_CHECK_TIMEOUT_SECONDS)
+        status_code, content = 500, {
+            "status": "unhealthy",
+            "error": "health check timed out"
+        }
+    health_cache = (time.monotonic(), status_code, content)
+
+
+def ensure_health_refresh() -> asyncio.Task:
+    """Start a health refresh unless one is already in flight, and return it"""
+    global health_refresh_task
+    if health_refresh_task is None or health_refresh_task.done():
+        health_refresh_task = asyncio.create_task(refresh_health_cache())
+    return health_refresh_task
+
+
+@app.get("/health")
+async def health_check():
+    """Comprehensive health check endpoint, served from the cached verdict"""
+    checked_at, status_code, content = health_cache
+    age = time.monotonic() - checked_at
+    if status_code is None or age > HEALTH_REFRESH_SECONDS:
+        # Single-flight: concurrent stale requests share one refresh
+        refresh = ensure_health_refresh()
+        if status_code is None or age > HEALTH_MAX_AGE_SECONDS:
+            # Too old to serve; the refresh is bounded by HEALTH_CHECK_TIMEOUT_SECONDS.
+            # Shield it so a disconnecting client doesn't cancel the shared refresh.
+            await asyncio.shield(refresh)
+            _, status_code, content = health_cache
+    # Otherwise serve the recent verdict while the refresh runs in the background
+    return JSONResponse(status_code=status_code, content=content)
 
 
 @app.api_route("/incoming-call-eleven", methods=["GET", "POST"])
@@ -116,7 +254,7 @@ async def handle_incoming_call(request: Request):
         response.append(connect)
         return HTMLResponse(content=str(response), media_type="application/xml")
     except Exception as e:
-        logger.error(f"Error handling incoming call: {e}")
+        logger.error("Error handling incoming call: %s", e)
         return JSONResponse(
             status_code=500,
             content={"error": "Failed to process incoming call"}
@@ -140,40 +278,45 @@ async def handle_media_stream(websocket: WebSocket):
             agent_id=settings.agent_id,
             requires_auth=True,
             audio_interface=audio_interface,
-            callback_agent_response=lambda text: logger.info(f"Agent Response: {text}"),
-            callback_user_transcript=lambda text: logger.info(f"User Transcript: {text}")
+            callback_agent_response=lambda text: logger.info("Agent Response: %s", text),
+            callback_user_transcript=lambda text: logger.info("User Transcript: %s", text)
         )
 
         logger.info("Starting conversation session")
         conversation.start_session()
 
-        async for message in websocket.iter_text():
+        async for message in iter_frames(websocket):
             if not message:
                 continue
 
             try:
-                data = json.loads(message)
-                await audio_interface.handle_twilio_message(data)
-            except json.JSONDecodeError:
-                logger.warning(f"Invalid JSON message: {message}")
+                if is_media_message(message):
+                    payload = extract_media_payload(message)
+                    if payload is None:
+                        payload = orjson.loads(message)["media"]["payload"]
+                    audio_interface.handle_media(payload)
+                else:
+                    await audio_interface.handle_control(orjson.loads(message))
+            except orjson.JSONDecodeError:
+                logger.warning("Invalid JSON message: %s", message)
             except Exception as message_error:
-                logger.error(f"Error processing WebSocket message: {message_error}")
-                logger.error(traceback.format_exc())
+                logger.error("Error processing WebSocket message: %s", message_error)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Traceback:\n%s", traceback.format_exc())
 
     except ApiError as api_error:
-        logger.error(f"ElevenLabs API Error: {api_error}")
+        logger.error("ElevenLabs API Error: %s", api_error)
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
     except Exception as e:
-        logger.error(f"Unexpected error in media stream: {e}")
-        logger.error(traceback.format_exc())
+        logger.error("Unexpected error in media stream: %s", e, exc_info=True)
     finally:
         if conversation:
             try:
                 conversation.end_session()
                 conversation.wait_for_session_end()
             except Exception as end_session_error:
-                logger.error(f"Error ending conversation session: {end_session_error}")
+                logger.error("Error ending conversation session: %s", end_session_error)
 
         logger.info("Media stream handler completed")
 
@@ -181,9 +324,20 @@ async def handle_media_stream(websocket: WebSocket):
 if __name__ == "__main__":
     import uvicorn
 
+    workers = get_worker_count()
+    # Exported so spawned workers pick their logging setup from the real worker count
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        # Each call is CPU-bound on the Python side, so scale calls across cores
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
+        # mu-law audio in base64 does not compress; skip zlib work on every frame
+        ws_per_message_deflate=False,
+        reload=False
     )
\ No newline at end of file